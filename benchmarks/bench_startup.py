@@ -0,0 +1,71 @@
+"""
+Startup time benchmark for the command line interface.
+
+It runs `python -X importtime -c "import freestor.cli"` several times in a
+fresh interpreter and reports the median cumulative import time of the cli
+module, as well as the median wall clock time of `python -m freestor --help`.
+
+It exits with a non zero status when the import time is above the target,
+so it can be tracked along with the other benchmarks.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--target 30]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cold start target for importing freestor.cli, in milliseconds
+TARGET_MS = 30
+
+
+def import_time(module):
+    """Return the cumulative import time of module, in milliseconds"""
+
+    cmd = [sys.executable, '-X', 'importtime', '-c', 'import %s' % module]
+    r = subprocess.run(cmd, cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    # lines are formatted as: "import time: self [us] | cumulative | imported package"
+    for line in r.stderr.splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000
+
+    raise RuntimeError('Import time not reported for %s' % module)
+
+
+def help_time():
+    """Return the wall clock time of `python -m freestor --help`, in milliseconds"""
+
+    cmd = [sys.executable, '-m', 'freestor', '--help']
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark freestor command line startup time')
+    parser.add_argument('--runs', type=int, default=10, help='Number of runs, default is 10.')
+    parser.add_argument('--target', type=float, default=TARGET_MS,
+                        help='Import time target in milliseconds, default is %s.' % TARGET_MS)
+    args = parser.parse_args()
+
+    imports = statistics.median(import_time('freestor.cli') for _ in range(args.runs))
+    helps = statistics.median(help_time() for _ in range(args.runs))
+
+    print('import freestor.cli: %.2f ms (target %.2f ms)' % (imports, args.target))
+    print('freestor --help: %.2f ms' % helps)
+
+    if imports > args.target:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+Capacity analytics over collected physical and virtual devices.
+
+Records, as returned by get_pdevs/get_vdevs or loaded back from their CSV
+output, are turned into NumPy columns once and all aggregates are computed
+on those columns. A history is just the concatenation of many snapshots,
+each record carrying the date and server it was collected from, so records
+of many servers can be analyzed together.
+
+It requires NumPy, installed with: pip install freestor[analytics]
+"""
+import numpy as np
+
+from datetime import datetime
+
+
+# date format set by collectors on every record
+DATE_FORMAT = '%Y%m%d_%H:%M:%S'
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def column(records, field):
+    """Return the numeric values of field on all records as an array, NaN where missing"""
+
+    values = [record.get(field) for record in records]
+    try:
+        return np.array([np.nan if value is None or value == '' else value for value in values], dtype=float)
+    except (TypeError, ValueError):
+        # some value is not a number, convert them one at a time
+        return np.array([_number(value) for value in values], dtype=float)
+
+
+def flag(records, field):
+    """Return the boolean values of field on all records as an array, False where missing"""
+
+    return np.array([str(record.get(field)).lower() in ('true', '1') for record in records], dtype=bool)
+
+
+def groups(records, by):
+    """
+    Group records by the given fields.
+
+    It returns the sorted group keys, as tuples, and an array with the
+    index of the group of each record.
+    """
+
+    keys = np.array(['\x1f'.join(str(record.get(field, '')) for field in by) for record in records])
+    labels, inverse = np.unique(keys, return_inverse=True)
+
+    return [tuple(label.split('\x1f')) for label in labels.tolist()], inverse.reshape(-1)
+
+
+def dates(records):
+    """
+    Return the date of all records as an array of days since epoch.
+
+    Dates are taken as they were stamped, in the collector local time, so the
+    integer part of each value is the day the record was collected on.
+    """
+
+    labels, inverse = np.unique(np.array([record.get('date', '') for record in records]), return_inverse=True)
+
+    # only unique dates are parsed, there are few of them even on long histories
+    days = np.array([(datetime.strptime(label, DATE_FORMAT) - EPOCH).total_seconds() / 86400
+                     for label in labels.tolist()])
+
+    return days[inverse.reshape(-1)]
+
+
+def _sum(inverse, size, values):
+    return np.bincount(inverse, weights=np.nan_to_num(values), minlength=size)
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def _rows(keys, by, columns):
+    """Build a list of dictionaries out of group keys and aggregated columns"""
+
+    data = []
+    for idx, key in enumerate(keys):
+        row = dict(zip(by, key))
+        row.update((name, values[idx].item()) for name, values in columns.items())
+        data.append(row)
+
+    return data
+
+
+def pool_usage(pdevs, by=('pool',)):
+    """
+    Aggregate physical device size and usage in MB by pool.
+
+    For example:
+
+    [
+        {'pool': 'pool1', 'devices': 4, 'size': 409600.0, 'used': 307200.0,
+        'free': 102400.0, 'fill': 0.75},
+    ]
+    """
+
+    keys, inverse = groups(pdevs, by)
+    size = _sum(inverse, len(keys), column(pdevs, 'size'))
+    used = _sum(inverse, len(keys), column(pdevs, 'used'))
+
+    return _rows(keys, by, {
+        'devices': np.bincount(inverse, minlength=len(keys)),
+        'size': size,
+        'used': used,
+        'free': size - used,
+        'fill': _ratio(used, size),
+    })
+
+
+def vdev_usage(vdevs, by=('server',)):
+    """
+    Aggregate virtual device provisioning, usage and dedupe savings in MB.
+
+    Thin devices are accounted as provisioned by fullsizemb, other devices by
+    sizemb. overcommit is the ratio between provisioned and used space. Dedupe
+    savings take usedmb as the stored space and deduperatio as the ratio between
+    logical and stored data.
+
+    For example:
+
+    [
+        {'server': '10.0.0.10', 'devices': 10, 'thin': 8, 'provisionedmb': 10240.0,
+        'usedmb': 2048.0, 'overcommit': 5.0, 'savedmb': 1024.0, 'deduperatio': 1.5},
+    ]
+    """
+
+    keys, inverse = groups(vdevs, by)
+    sizemb = column(vdevs, 'sizemb')
+    fullsizemb = column(vdevs, 'fullsizemb')
+    usedmb = column(vdevs, 'usedmb')
+    deduperatio = column(vdevs, 'deduperatio')
+    thin = flag(vdevs, 'thin')
+
+    provisioned = np.where(thin & ~np.isnan(fullsizemb), fullsizemb, sizemb)
+    saved = np.where(deduperatio > 1, np.nan_to_num(usedmb) * (deduperatio - 1), 0)
+
+    provisionedmb = _sum(inverse, len(keys), provisioned)
+    used = _sum(inverse, len(keys), usedmb)
+    savedmb = _sum(inverse, len(keys), saved)
+
+    return _rows(keys, by, {
+        'devices': np.bincount(inverse, minlength=len(keys)),
+        'thin': np.bincount(inverse, weights=thin, minlength=len(keys)).astype(int),
+        'provisionedmb': provisionedmb,
+        'usedmb': used,
+        'overcommit': _ratio(provisionedmb, used),
+        'savedmb': savedmb,
+        'deduperatio': _ratio(used + savedmb, used),
+    })
+
+
+def forecast(history, value, capacity=None, by=('server',), days=30):
+    """
+    Fit a linear growth of the value field summed by group over time.
+
+    history holds records of one or many snapshots, each with its date and server.
+    Every server stamps its own time, so snapshots are bucketed by day: each
+    server contributes to a group the value of its latest snapshot on that day,
+    and those are summed across servers. For each group it returns the number
+    of days sampled, the latest value, the growth per day, the value projected
+    after the given number of days and, when a capacity field is given, the
+    capacity on the latest day and the days left until it's full.
+
+    For example, forecast(pdevs, 'used', 'size', by=('pool',)):
+
+    [
+        {'pool': 'pool1', 'samples': 30, 'used': 307200.0, 'growthperday': 1024.0,
+        'forecast': 337920.0, 'size': 409600.0, 'daystofull': 100.0},
+    ]
+    """
+
+    if not history:
+        return []
+
+    keys, inverse = groups(history, by)
+
+    # each server series of a group, mapped back to its group
+    series, series_inverse = groups(history, ('server',) + tuple(field for field in by if field != 'server'))
+    series_group = np.zeros(len(series), dtype=int)
+    series_group[series_inverse] = inverse
+
+    day = dates(history)
+    day_labels, day_inverse = np.unique(np.floor(day), return_inverse=True)
+    day_inverse = day_inverse.reshape(-1)
+
+    # only the latest snapshot of each series on a day is kept, so many runs
+    # on the same day are not summed together
+    cell = series_inverse * len(day_labels) + day_inverse
+    latest_date = np.full(len(series) * len(day_labels), -np.inf)
+    np.maximum.at(latest_date, cell, day)
+    kept = day == latest_date[cell]
+
+    # (group, day) cell each (series, day) cell is summed into
+    shape = (len(keys), len(day_labels))
+    group_cell = (np.repeat(series_group, len(day_labels)) * len(day_labels)
+                  + np.tile(np.arange(len(day_labels)), len(series)))
+
+    def grid(field):
+        """Sum field on the (group, day) grid out of the latest snapshot of each series"""
+
+        weights = np.where(kept, np.nan_to_num(column(history, field)), 0)
+        totals = np.bincount(cell, weights=weights, minlength=len(latest_date))
+        return np.bincount(group_cell, weights=totals, minlength=shape[0] * shape[1]).reshape(shape)
+
+    totals = grid(value)
+    present = np.bincount(inverse * len(day_labels) + day_inverse, minlength=shape[0] * shape[1]).reshape(shape) > 0
+
+    # least squares fit of all groups at once, days relative to the first one
+    x = np.where(present, day_labels - day_labels[0], 0)
+    y = np.where(present, totals, 0)
+    n = present.sum(axis=1)
+    sx, sy = x.sum(axis=1), y.sum(axis=1)
+    sxx, sxy = (x * x).sum(axis=1), (x * y).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(n * sxx - sx * sx > 0, (n * sxy - sx * sy) / (n * sxx - sx * sx), np.nan)
+
+    # latest day of each group
+    last = shape[1] - 1 - np.argmax(present[:, ::-1], axis=1)
+    latest = totals[np.arange(shape[0]), last]
+
+    columns = {
+        'samples': n,
+        value: latest,
+        'growthperday': slope,
+        'forecast': latest + np.nan_to_num(slope) * days,
+    }
+
+    if capacity:
+        size = grid(capacity)[np.arange(shape[0]), last]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns[capacity] = size
+            columns['daystofull'] = np.where(slope > 0, (size - latest) / slope, np.inf)
+
+    return _rows(keys, by, columns)
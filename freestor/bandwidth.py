@@ -0,0 +1,215 @@
+"""Replication bandwidth testing across replica servers."""
+import csv
+import time
+import threading
+
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from freestor.sinks import Sink, open_text, with_extension
+
+
+# fields stored for each bandwidth test, also used as CSV header for history files
+FIELDS = ['date', 'server', 'target', 'rc', 'throughputmbps', 'elapsed', 'error']
+
+# keys that may carry the measured throughput on the test response, the
+# value reported by the server is expected to be in MB/s
+THROUGHPUT_KEYS = ('throughput', 'bandwidth', 'speed')
+
+
+def get_replica_targets(freestor):
+    """
+    Return the list of replica server addresses configured for outgoing replication.
+
+    For example:
+    ['10.0.0.20', '10.0.0.21']
+    """
+
+    targets = []
+    for server in freestor.get_outgoing_replication_servers() or []:
+        target = server.get('ipaddress') or server.get('name')
+        if target and target not in targets:
+            targets.append(target)
+
+    return targets
+
+
+def parse_bandwidth(response):
+    """
+    Parse a replication test response into a throughput number in MB/s.
+
+    response may be either a requests response or its already decoded json.
+    It returns a tuple (rc, throughput), throughput being None when it
+    could not be found in the response.
+    """
+
+    if hasattr(response, 'json'):
+        response = response.json()
+
+    rc = response.get('rc')
+    data = response.get('data')
+
+    # the throughput may come either inside data or as data itself
+    if isinstance(data, dict):
+        for key in THROUGHPUT_KEYS:
+            if key in data:
+                data = data.get(key)
+                break
+
+    try:
+        throughput = float(data)
+    except (TypeError, ValueError):
+        throughput = None
+
+    return rc, throughput
+
+
+class BandwidthTester:
+    """
+    Run replication bandwidth tests against many replica servers.
+
+    Tests are started at least `interval` seconds apart and no more than
+    `concurrency` of them run at the same time, so links are not saturated
+    all at once.
+    """
+
+    def __init__(self, freestor, concurrency=1, interval=0):
+        self.freestor = freestor
+        self.concurrency = concurrency
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last_start = None
+
+    def _wait_turn(self):
+        """Block until interval seconds have passed since the last test started"""
+
+        if not self.interval:
+            return
+
+        # the lock is held while sleeping so waiting tests start one at a time
+        with self._lock:
+            now = time.monotonic()
+            if self._last_start is not None:
+                delay = self._last_start + self.interval - now
+                if delay > 0:
+                    time.sleep(delay)
+                    now = time.monotonic()
+            self._last_start = now
+
+    def test(self, target):
+        """Run a single bandwidth test and return its result as a dictionary"""
+
+        self._wait_turn()
+
+        result = dict.fromkeys(FIELDS)
+        result.update({'server': self.freestor.server, 'target': target})
+
+        start = time.time()
+        try:
+            r = self.freestor.get_badwidth(target)
+            r.raise_for_status()
+            result['rc'], result['throughputmbps'] = parse_bandwidth(r)
+
+            # the server answered but reports the test itself failed
+            if result['rc']:
+                result['error'] = 'Bandwidth test failed with rc %s' % result['rc']
+        except Exception as e:
+            result['error'] = str(e)
+        result['elapsed'] = round(time.time() - start, 3)
+
+        return result
+
+    def run(self, targets=None):
+        """
+        Test bandwidth with all given targets, or all outgoing replica servers
+        when no targets are given, and return a list with the results.
+        """
+
+        d = datetime.now()
+        date = d.strftime("%Y%m%d_%X")
+
+        if targets is None:
+            targets = get_replica_targets(self.freestor)
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for target in targets:
+                futures.append(executor.submit(self.test, target))
+
+        data = []
+        for future in futures:
+            result = future.result()
+
+            # Also add date to enable historical comparison on outputed data
+            #
+            result['date'] = date
+            data.append(result)
+
+        return data
+
+
+def save_history(data, filename, **options):
+    """
+    Append bandwidth test results to a CSV history file
+
+    The file is written through a Sink, options are passed to it, so history
+    can be compressed and rotated. The compression extension is added to
+    filename when it's missing.
+    """
+
+    filename = with_extension(filename, options.get('compression'))
+    with Sink(filename, 'a', **options) as fp:
+        writer = csv.DictWriter(fp, fieldnames=FIELDS)
+        if fp.new:
+            writer.writeheader()
+        for result in data:
+            writer.writerow(result)
+
+
+def load_history(filename):
+    """Load bandwidth test results from a CSV history file"""
+
+    with open_text(filename) as fp:
+        data = list(csv.DictReader(fp))
+
+    for result in data:
+        try:
+            result['throughputmbps'] = float(result['throughputmbps'])
+        except (TypeError, ValueError):
+            result['throughputmbps'] = None
+
+    return data
+
+
+def compare(previous, current):
+    """
+    Compare two sets of bandwidth results per server and target.
+
+    It returns a list of dictionaries with the previous and current throughput
+    and the change between them as a percentage, for example:
+
+    [
+        {'server': '10.0.0.10', 'target': '10.0.0.20', 'previous': 100.0,
+        'current': 80.0, 'change': -20.0},
+    ]
+    """
+
+    last = {}
+    for result in previous:
+        if result.get('throughputmbps') is not None:
+            last[(result.get('server'), result.get('target'))] = result.get('throughputmbps')
+
+    trend = []
+    for result in current:
+        key = (result.get('server'), result.get('target'))
+        before = last.get(key)
+        now = result.get('throughputmbps')
+
+        change = None
+        if before and now is not None:
+            change = round((now - before) / before * 100, 2)
+
+        trend.append({'server': key[0], 'target': key[1], 'previous': before,
+                      'current': now, 'change': change})
+
+    return trend
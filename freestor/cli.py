@@ -1,7 +1,5 @@
 """Command line interface."""
 import sys
-import csv
-import json
 import argparse
 
 from getpass import getpass
@@ -9,14 +7,13 @@ from getpass import getpass
 from freestor import FreeStor
 
 
-def f_csv(data, caller, filename=None):
-    """Output data in CSV format"""
+def f_csv(data, caller, filename=None, fields=None, **options):
+    """
+    Output data in CSV format, restricted to the given fields if any
 
-    if filename:
-        output = open(filename, 'w')
-    else:
-        # output data to standard output
-        output = sys.stdout
+    Files are written through a Sink, options are passed to it.
+    """
+    import csv
 
     # define header for each function, fields based on REST API documentation
     # fields will vary for each type of device
@@ -30,32 +27,61 @@ def f_csv(data, caller, filename=None):
             'cacheenabled','cacheid','cachemirrored','cachemirrorsuspended','hotzoneenabled','hotzoneid',
             'hotzonemirrored','hotzonemirrorsuspended','cdpenabled','cdpid','cdpmirrored','cdpmirrorsuspended',
             'hasnearlinemirror','isnearlinemirror','nearlinesourceserverip','nearlinesourcedeviceid',
-            'timeviewlinkid','preferrednode','pdev'
+            'timeviewlinkid','preferrednode','pdev','server'
         ]
     elif caller == 'pdevs':
         header = [
             'date','id','acsl','wwid','name','size','used','status','category','product','vendor','inquirystring',
-            'isforeign','owner','inpool','pool','queuedepth','firmware','geometry','scsiaddress','segments',
+            'isforeign','owner','inpool','pool','queuedepth','firmware','geometry','scsiaddress','segments','server'
         ]
     elif caller == 'licenses':
-        header = ['date', 'key', 'type', 'registration', 'asciikeycode', 'info']
+        header = ['date', 'key', 'type', 'registration', 'asciikeycode', 'info', 'server']
     elif caller == 'replication':
-        header = ['date','guid', 'name','replicationpolicy']
+        header = ['date','guid', 'name','replicationpolicy','server']
+    elif caller == 'bandwidth':
+        header = ['date','server','target','rc','throughputmbps','elapsed','error']
+    elif caller == 'trend':
+        header = ['server','target','previous','current','change']
+
+    # output only the requested fields, ignoring any other one on the data
+    extrasaction = 'raise'
+    if fields:
+        header = fields
+        extrasaction = 'ignore'
+
+    def write(output):
+        writer = csv.DictWriter(output, fieldnames=header, extrasaction=extrasaction)
+        writer.writeheader()
+        for device in data:
+            writer = csv.DictWriter(output, fieldnames=header, extrasaction=extrasaction)
+            writer.writerow(device)
+
+    if filename:
+        from freestor.sinks import Sink
+
+        # an interrupted write leaves no truncated file behind
+        with Sink(filename, **options) as fp:
+            write(fp)
+    else:
+        # output data to standard output
+        write(sys.stdout)
 
-    writer = csv.DictWriter(output, fieldnames=header)
-    writer.writeheader()
-    for device in data:
-        writer = csv.DictWriter(output, fieldnames=header)
-        writer.writerow(device)
 
-    output.close()
+def f_json(data, caller, filename=None, fields=None, **options):
+    """
+    Output data in JSON format, restricted to the given fields if any
 
+    Files are written through a Sink, options are passed to it.
+    """
+    import json
 
-def f_json(data, caller, filename=None):
-    """Output data in JSON format"""
+    if fields:
+        data = [{field: item[field] for field in fields if field in item} for item in data]
 
     if filename:
-        with open(filename, 'w') as fp:
+        from freestor.sinks import Sink
+
+        with Sink(filename, **options) as fp:
             json.dump(data, fp)
     else:
         print(json.dumps(data, indent=4))
@@ -70,36 +96,122 @@ def main():
     parser.add_argument('--username', '-u', help='Username', required=True)
     parser.add_argument('--password', '-p', help='Password')
 
+    parser.add_argument('--session-cache', nargs='?', const=True, metavar='FILENAME',
+                        help='Reuse session ids across runs, cached at ~/.cache/freestor/sessions.json unless a filename is given.')
+
     parser.add_argument('--get-pdevs', action='store_true', help='Get all physical disk devices information')
     parser.add_argument('--get-vdevs', action='store_true', help='Get all virtual disk devices information')
     parser.add_argument('--get-licenses', action='store_true', help='Get all licenses information')
     parser.add_argument('--get-replication-status', action='store_true', help='Get replication status for all devices')
 
+    parser.add_argument('--stream', action='store_true', help='Parse physical and virtual device lists while they are downloaded.')
+
+    parser.add_argument('--test-bandwidth', action='store_true', help='Test replication bandwidth with all replica servers')
+    parser.add_argument('--concurrency', type=int, default=1, help='Number of bandwidth tests run at the same time, default is 1.')
+    parser.add_argument('--interval', type=float, default=0, help='Seconds to wait between starting bandwidth tests, default is 0.')
+    parser.add_argument('--history', help='Appends bandwidth test results to the specified CSV history file, compressed if it ends with .gz or .zst.')
+    parser.add_argument('--trend', action='store_true',
+                        help='Output the throughput change of each bandwidth test against the last result on the history file instead.')
+
     parser.add_argument('--json', help='Output data in JSON format, default is CSV.', action='store_const', dest='output', const=f_json, default=f_csv)
     parser.add_argument('--filename', help='Writes output to the specified filename.')
+    parser.add_argument('--fields', type=lambda fields: fields.split(','),
+                        help='Comma separated list of fields to output, default is all fields.')
+
+    parser.add_argument('--compress', choices=['gzip', 'zstd'],
+                        help='Compress output files, adding the extension to the filename, default is to compress them only if the filename ends with .gz or .zst.')
+    parser.add_argument('--rotate-size', type=int, metavar='BYTES', help='Rotate output files once they reach the specified size.')
+    parser.add_argument('--rotate-interval', type=int, metavar='SECONDS',
+                        help='Rotate output files last written before the current interval, e.g. 86400 for daily files.')
+    parser.add_argument('--backups', type=int, default=5, help='Number of rotated output files to keep, default is 5.')
+
+    parser.add_argument('--profile', action='store_true', help='Report time spent by each collector on network, decode, merge and serialize to standard error.')
+    parser.add_argument('--profile-dump', metavar='DIRECTORY', help='Same as --profile, also dumping cProfile stats and tracemalloc snapshots to the specified directory.')
 
     args = parser.parse_args()
 
+    if args.trend and not args.history:
+        parser.error('--trend requires --history')
+
     output = args.output
     filename = args.filename
+    if filename:
+        from freestor.sinks import with_extension
+
+        # files are read back according to their extension
+        filename = with_extension(filename, args.compress)
+    fields = args.fields
+    options = {
+        'compression': args.compress,
+        'max_bytes': args.rotate_size,
+        'interval': args.rotate_interval,
+        'backups': args.backups,
+    }
     password = args.password or getpass("Provide %s's password: " % args.username)
 
-    freestor = FreeStor(args.server, args.username, password)
+    profiler = None
+    if args.profile or args.profile_dump:
+        from freestor.profiling import Profiler
+
+        dump = bool(args.profile_dump)
+        profiler = Profiler(cprofile=dump, tracemalloc=dump, dump_dir=args.profile_dump)
+
+    def write(data, caller, collector):
+        """Output data accounting the time spent as serialization of the given collector"""
+
+        if profiler is None:
+            return output(data, caller, filename, fields, **options)
+
+        with profiler.phase('serialize', collector):
+            output(data, caller, filename, fields, **options)
+
+    session_cache = None
+    if args.session_cache:
+        from freestor.session import SessionCache
+
+        cache_file = None if args.session_cache is True else args.session_cache
+        session_cache = SessionCache(cache_file)
 
-    assert freestor.get_session_id()
+    freestor = FreeStor(args.server, args.username, password, session_cache, profiler)
+
+    assert freestor.session_id
 
     if args.get_pdevs:
-        data = freestor.get_pdevs()
-        output(data, 'pdevs', filename)
+        data = freestor.get_pdevs(fields, args.stream)
+        write(data, 'pdevs', 'get_pdevs')
 
     if args.get_vdevs:
-        data = freestor.get_vdevs()
-        output(data, 'vdevs', filename)
+        data = freestor.get_vdevs(fields, args.stream)
+        write(data, 'vdevs', 'get_vdevs')
 
     if args.get_licenses:
-        data = freestor.get_licenses()
-        output(data, 'licenses', filename)
+        data = freestor.get_licenses(fields)
+        write(data, 'licenses', 'get_licenses')
 
     if args.get_replication_status:
-        data = freestor.get_replication_status()
-        output(data, 'replication', filename)
\ No newline at end of file
+        data = freestor.get_replication_status(fields)
+        write(data, 'replication', 'get_replication_status')
+
+    if args.test_bandwidth:
+        import os
+        from freestor.bandwidth import BandwidthTester, save_history, load_history, compare
+
+        tester = BandwidthTester(freestor, args.concurrency, args.interval)
+        data = tester.run()
+
+        # compare against the history as it was before this run is added to it
+        previous = None
+        if args.trend:
+            previous = load_history(args.history) if os.path.exists(args.history) else []
+
+        # the history is a single file growing across runs, report options don't apply to it
+        if args.history:
+            save_history(data, args.history)
+
+        if args.trend:
+            output(compare(previous, data), 'trend', filename, fields, **options)
+        else:
+            output(data, 'bandwidth', filename, fields, **options)
+
+    if profiler:
+        print(profiler.format_report(), file=sys.stderr)
@@ -1,7 +1,12 @@
-import requests
 import json
 
 from datetime import datetime
+from functools import wraps
+from contextlib import contextmanager
+
+
+# bytes read at a time from streamed responses
+CHUNK_SIZE = 64 * 1024
 
 
 def format_wwpn(wwpn, delimiter='-'):
@@ -14,40 +19,164 @@ def format_wwpn(wwpn, delimiter='-'):
     return wwpn
 
 
+def merge_fields(stamp, fields, *records):
+    """
+    Merge records into a single dictionary along with the given stamp.
+
+    stamp holds the fields set by collectors on every record, the date and
+    server they were collected from, and always takes precedence over fields
+    of the same name on the records. Records are merged in order, so later
+    ones overlap earlier ones. When fields is given only those fields are
+    kept, in the given order, and fields not found on any record are left out.
+    """
+
+    if not fields:
+        # date leads each record and other stamp fields follow the collected ones
+        merged = {'date': stamp['date']}
+        for record in records:
+            merged.update(record)
+        merged.update(stamp)
+
+        return merged
+
+    merged = {}
+    for field in fields:
+        if field in stamp:
+            merged[field] = stamp[field]
+            continue
+
+        for record in reversed(records):
+            if field in record:
+                merged[field] = record[field]
+                break
+
+    return merged
+
+
+def has_fields(record, fields):
+    """Check whether record holds all the given fields, date and server are always available"""
+
+    return bool(fields) and all(field in record for field in fields if field not in ('date', 'server'))
+
+
+@contextmanager
+def _no_phase():
+    yield
+
+
+def profiled(method):
+    """Account the decorated collector on the FreeStor profiler, if there is one"""
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.profiler is None:
+            return method(self, *args, **kwargs)
+
+        with self.profiler.collector(method.__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
 class FreeStor:
-    def __init__(self, server, username, password):
+    def __init__(self, server, username, password, session_cache=None, profiler=None):
         self.server = server
         self.username = username
         self.password = password
         self.headers = {'Content-Type': 'application/json'}
-        self.session_id = self.get_session_id()
+        self.session_cache = session_cache
+        self.profiler = profiler
+
+        if session_cache:
+            self.session_id = session_cache.get(server, username, self.get_session_id)
+        else:
+            self.session_id = self.get_session_id()
 
     def _url(self, path):
         return 'http://%s:/ipstor/%s' % (self.server, path)
 
-    def _get(self, url):
+    def _phase(self, name):
+        """Account time spent on the returned context to the given profiler phase"""
+
+        if self.profiler is None:
+            return _no_phase()
+
+        return self.profiler.phase(name)
+
+    def _request(self, method, url, session=True, **kwargs):
+        """
+        Send a request with the current session id and return its response.
+
+        If the server rejects a cached session id a new one is requested and
+        the request is sent once again. When session is False the request is
+        sent without a session id, as done to login.
+        """
+        import requests
+
+        if session:
+            kwargs['cookies'] = {'session_id': self.session_id}
+
+        with self._phase('network'):
+            r = requests.request(method, url, **kwargs)
+
+        # a cached session may have expired on the server, get a new one and retry
+        if session and r.status_code == 401 and self.session_cache:
+            r.close()
+            kwargs['cookies'] = {'session_id': self.refresh_session_id()}
+            with self._phase('network'):
+                r = requests.request(method, url, **kwargs)
+
+        return r
+
+    def _get(self, url, stream=False):
         import sys
+        import requests
 
         try:
-            r = requests.get(url, cookies={'session_id': self.session_id})
+            r = self._request('GET', url, stream=stream)
             r.raise_for_status()
         except requests.exceptions.RequestException as e:
             print(e)
             sys.exit(1)
 
-        return r.json()
+        # when streaming the response body is left to be read by the caller
+        if stream:
+            return r
+
+        with self._phase('decode'):
+            return r.json()
+
+    def _get_array(self, url, *path):
+        """Yield each element of the array found at path on the response, while it's downloaded"""
+        from freestor.stream import iter_json_array
+
+        r = self._get(url, stream=True)
+        try:
+            chunks = r.iter_content(CHUNK_SIZE)
+            if self.profiler:
+                chunks = self.profiler.timed(chunks, 'network')
 
-    def _post(self, url, data):
+            elements = iter_json_array(chunks, *path)
+            if self.profiler:
+                elements = self.profiler.timed(elements, 'decode')
+
+            yield from elements
+        finally:
+            r.close()
+
+    def _post(self, url, data, session=True):
         import sys
+        import requests
 
         try:
-            r = requests.post(url, headers=self.headers, data=data)
+            r = self._request('POST', url, session, headers=self.headers, data=data)
             r.raise_for_status()
         except requests.exceptions.RequestException as e:
             print(e)
             sys.exit(1)
 
-        return r.json()
+        with self._phase('decode'):
+            return r.json()
 
     def get_session_id(self):
         """Get a session id to be used in later requests"""
@@ -57,12 +186,20 @@ class FreeStor:
         )
 
         URL = self._url('auth/login')
-        r = self._post(URL, data)
+        r = self._post(URL, data, session=False)
 
         self.session_id = r.get('id')
 
         return self.session_id
 
+    def refresh_session_id(self):
+        """Discard the current session id from the cache and get a valid one"""
+
+        self.session_cache.invalidate(self.server, self.username, self.session_id)
+        self.session_id = self.session_cache.get(self.server, self.username, self.get_session_id)
+
+        return self.session_id
+
     def get_fc_adapters(self):
         """
         Query the server and return a list of all fiber channel adapter IDs.
@@ -140,19 +277,25 @@ class FreeStor:
 
         return fc_detail
 
-    def get_fc_detail_all(self):
+    @profiled
+    def get_fc_detail_all(self, compression=None, **options):
         """
         Get detail for all fiber channel adapters and dump it on a csv file.
 
         It uses get_fc_adapters in order to get a list of all fc adapters
         available on the server and then iterate through each one of them
         executing get_fc_detail in order to gather the required information.
+
+        The file is written through a Sink, compressed with the given
+        compression if any, other options are passed to the Sink as well.
         """
+        from freestor.sinks import Sink, with_extension
 
         #Prepare output file
         d = datetime.now()
         date = d.strftime("%Y%m%d_%H%M%S")
         f_name = 'fc_adapters_info_{}.csv'.format(date)
+        f_name = with_extension(f_name, compression)
         header = ('server,adapter,vendor,fc mode,status,wwpn,wwpn mode\n')
 
         #Query server for adapter detail
@@ -162,7 +305,7 @@ class FreeStor:
             fca_detail = self.get_fc_detail(fca)
             adapters_detail.append(fca_detail)
 
-        with open(f_name, 'w') as fp:
+        with self._phase('serialize'), Sink(f_name, compression=compression, **options) as fp:
             fp.write(header)
             for fc in adapters_detail:
                 for line in fc:
@@ -217,10 +360,18 @@ class FreeStor:
 
         return adapters
 
-    def get_virtual_device(self):
-        """Retrieve status information about all virtual devices and supporting devices."""
+    def get_virtual_device(self, stream=False):
+        """
+        Retrieve status information about all virtual devices and supporting devices.
+
+        If stream is True an iterator is returned instead, yielding each device
+        as soon as it's received.
+        """
         
         URL = self._url('logicalresource/sanresource/')
+        if stream:
+            return self._get_array(URL, 'data', 'virtualdevices')
+
         r = self._get(URL)
         
         # extract virtual device data out of the response
@@ -234,27 +385,40 @@ class FreeStor:
 
         return r.get('data')
 
-    def get_vdevs(self):
-        """Gather all virtual devices information"""
+    @profiled
+    def get_vdevs(self, fields=None, stream=False):
+        """
+        Gather all virtual devices information
+
+        If fields is given only those fields are kept for each device.
+        If stream is True the device list is parsed while it's downloaded,
+        so details are requested before the whole list is received.
+        """
 
         d = datetime.now()
         date = d.strftime("%Y%m%d_%X")
+        stamp = {'date': date, 'server': self.server}
 
         data = []
-        all_devices = self.get_virtual_device()
+        all_devices = self.get_virtual_device(stream)
         for device in all_devices:
             guid = device.get('id')
 
-            device_detail = self.get_virtual_device_details(guid)
+            # Skip the detail request when the list already holds every requested field
+            if has_fields(device, fields):
+                device_detail = {}
+            else:
+                device_detail = self.get_virtual_device_details(guid)
 
             # Merge device and device_detail dictionaries in order to have a single
             # dictionary with all information for the given physical device.
             # There are 6 duplicate keys which contains same value and overlap on them,
             # they are: name, category, isforeign, size, used and status
             #
-            # Also add date to enable historical comparison on outputed data
+            # Also add date and server to enable historical comparison on outputed data
             #
-            data.append({**{'date': date}, **device, **device_detail})
+            with self._phase('merge'):
+                data.append(merge_fields(stamp, fields, device, device_detail))
 
         return data
 
@@ -267,7 +431,7 @@ class FreeStor:
             "action": "test",  
             "ipaddress": server_t
         })
-        r = requests.put(URL, cookies={'session_id': self.session_id}, data=data, headers=self.headers)
+        r = self._request('PUT', URL, data=data, headers=self.headers)
 
         return r
 
@@ -303,11 +467,17 @@ class FreeStor:
 
         return r.get('data')
 
-    def get_replication_status(self):
-        """Returns incoming replication status for a replica device"""
+    @profiled
+    def get_replication_status(self, fields=None):
+        """
+        Returns incoming replication status for a replica device
+
+        If fields is given only those fields are kept for each device.
+        """
 
         d = datetime.now()
         date = d.strftime("%Y%m%d_%X")
+        stamp = {'date': date, 'server': self.server}
 
         outgoing_rep = self.get_outgoing_replication_servers()
 
@@ -317,18 +487,30 @@ class FreeStor:
 
             device_detail = self.get_replication_detail(device)
 
-            # Also add date to enable historical comparison on outputed data
+            # Also add date and server to enable historical comparison on outputed data
             #
-            device_detail.update({'date': date})
+            with self._phase('merge'):
+                if fields:
+                    device_detail = merge_fields(stamp, fields, device_detail)
+                else:
+                    device_detail.update(stamp)
 
             data.append(device_detail)
 
         return data
 
-    def get_physical_devices(self):
-        """Get physical devices information"""
+    def get_physical_devices(self, stream=False):
+        """
+        Get physical devices information
+
+        If stream is True an iterator is returned instead, yielding each device
+        as soon as it's received.
+        """
 
         URL = self._url('physicalresource/physicaldevice/')
+        if stream:
+            return self._get_array(URL, 'data', 'physicaldevices')
+
         r = self._get(URL)
         # extract physical device data out of the response
 
@@ -342,27 +524,40 @@ class FreeStor:
 
         return r.get('data')
 
-    def get_pdevs(self):
-        """Gather all physical devices information"""
+    @profiled
+    def get_pdevs(self, fields=None, stream=False):
+        """
+        Gather all physical devices information
+
+        If fields is given only those fields are kept for each device.
+        If stream is True the device list is parsed while it's downloaded,
+        so details are requested before the whole list is received.
+        """
 
         d = datetime.now()
         date = d.strftime("%Y%m%d_%X")
+        stamp = {'date': date, 'server': self.server}
 
         data = []
-        all_devices = self.get_physical_devices()
+        all_devices = self.get_physical_devices(stream)
         for device in all_devices:
             guid = device.get('id')
 
-            device_detail = self.get_physical_device_detail(guid)
+            # Skip the detail request when the list already holds every requested field
+            if has_fields(device, fields):
+                device_detail = {}
+            else:
+                device_detail = self.get_physical_device_detail(guid)
 
             # Merge device and device_detail dictionaries in order to have a single
             # dictionary with all information for the given physical device.
             # There are 6 duplicate keys which contains same value and overlap on them,
             # they are: name, category, isforeign, size, used and status
             #
-            # Also add date to enable historical comparison on outputed data
+            # Also add date and server to enable historical comparison on outputed data
             #
-            data.append({**{'date': date}, **device, **device_detail})
+            with self._phase('merge'):
+                data.append(merge_fields(stamp, fields, device, device_detail))
 
         return data
 
@@ -384,25 +579,36 @@ class FreeStor:
 
         return r.get('data')
 
-    def get_licenses(self):
-        """Gather all licenses information"""
+    @profiled
+    def get_licenses(self, fields=None):
+        """
+        Gather all licenses information
+
+        If fields is given only those fields are kept for each license.
+        """
 
         d = datetime.now()
         date = d.strftime("%Y%m%d_%X")
+        stamp = {'date': date, 'server': self.server}
 
         data = []
         licenses = self.enumerate_licenses()
         for license in licenses:
             key = license.get('key')
 
-            license_detail = self.get_license_detail(key)
+            # Skip the detail request when the list already holds every requested field
+            if has_fields(license, fields):
+                license_detail = {}
+            else:
+                license_detail = self.get_license_detail(key)
 
             # Merge license and license_detail dictionaries in order to have
             # a single dictionary with all license information.
             #
-            # Also add date to enable historical comparison on outputed data
+            # Also add date and server to enable historical comparison on outputed data
             #
-            data.append({**{'date': date}, **license, **license_detail})
+            with self._phase('merge'):
+                data.append(merge_fields(stamp, fields, license, license_detail))
 
         return data
 
@@ -483,6 +689,6 @@ class FreeStor:
             "autodetect": True,
             "readfrominactive": True
         })
-        r = requests.put(URL, cookies={'session_id': self.session_id}, data=data, headers=self.headers)
+        r = self._request('PUT', URL, data=data, headers=self.headers)
 
         return r
\ No newline at end of file
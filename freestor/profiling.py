@@ -0,0 +1,160 @@
+"""Time collectors broken down into network, decode, merge and serialize phases."""
+import os
+import time
+
+from contextlib import contextmanager
+
+
+PHASES = ['network', 'decode', 'merge', 'serialize']
+
+
+class Profiler:
+    """
+    Accumulate time spent by each collector on each phase.
+
+    Phase times are exclusive, time spent on a phase nested in another one
+    is only accounted to the inner phase. Time a collector spends outside
+    of any phase is reported as other. Phases run outside of a collector
+    are not accounted.
+
+    When cprofile or tracemalloc are True a cProfile stats file and a
+    tracemalloc snapshot are dumped to dump_dir for each collector run,
+    dump_dir is created up front if it doesn't exist.
+    """
+
+    def __init__(self, cprofile=False, tracemalloc=False, dump_dir='.'):
+        self.cprofile = cprofile
+        self.tracemalloc = tracemalloc
+        self.dump_dir = dump_dir
+        self.stats = {}
+
+        # fail before any collector runs rather than losing its work afterwards
+        if cprofile or tracemalloc:
+            os.makedirs(dump_dir, exist_ok=True)
+
+        self._collector = None
+        self._stack = []
+
+    def _stats(self, name):
+        return self.stats.setdefault(name, dict.fromkeys(['calls', 'total'] + PHASES, 0))
+
+    def _dump_name(self, name, extension):
+        d = time.strftime("%Y%m%d_%H%M%S")
+        calls = self.stats[name]['calls']
+        return os.path.join(self.dump_dir, '{}_{}_{}.{}'.format(name, d, calls, extension))
+
+    @contextmanager
+    def collector(self, name):
+        """Account time and phases run inside this context to the named collector"""
+
+        # collectors may call each other, only the outer one is accounted
+        if self._collector is not None:
+            yield
+            return
+
+        stats = self._stats(name)
+        stats['calls'] += 1
+        self._collector = name
+
+        if self.cprofile:
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+
+        if self.tracemalloc:
+            import tracemalloc
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats['total'] += time.perf_counter() - start
+            self._collector = None
+
+            if self.cprofile:
+                profile.disable()
+                profile.dump_stats(self._dump_name(name, 'prof'))
+
+            if self.tracemalloc:
+                tracemalloc.take_snapshot().dump(self._dump_name(name, 'tracemalloc'))
+                stats['peakmemory'] = max(stats.get('peakmemory', 0), tracemalloc.get_traced_memory()[1])
+                if started:
+                    tracemalloc.stop()
+
+    @contextmanager
+    def phase(self, name, collector=None):
+        """
+        Account time spent inside this context to the given phase of the current collector
+
+        If collector is given the time is accounted to that collector instead,
+        adding it to its total too, without accounting a new call of it. It's
+        meant for work done on behalf of a collector after it returned, like
+        output serialization.
+        """
+
+        # time of nested phases, to be discounted from this one
+        self._stack.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+
+            if collector is not None:
+                stats = self._stats(collector)
+                stats[name] += elapsed - nested
+                stats['total'] += elapsed
+            elif self._collector is not None:
+                self.stats[self._collector][name] += elapsed - nested
+
+    def timed(self, iterable, name):
+        """Yield items from iterable accounting the time to get each one to the given phase"""
+
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self):
+        """
+        Return a list with the time spent by each collector on each phase.
+
+        For example:
+
+        [
+            {'collector': 'get_vdevs', 'calls': 1, 'total': 2.5, 'network': 2.1,
+            'decode': 0.3, 'merge': 0.05, 'serialize': 0.02, 'other': 0.03},
+        ]
+        """
+
+        data = []
+        for name, stats in self.stats.items():
+            row = {'collector': name}
+            row.update(stats)
+            row['other'] = max(stats['total'] - sum(stats[phase] for phase in PHASES), 0)
+            data.append(row)
+
+        return data
+
+    def format_report(self):
+        """Return the report as a text table, times in seconds"""
+
+        columns = ['total'] + PHASES + ['other']
+        lines = ['{:<24}{:>6}'.format('collector', 'calls') +
+                 ''.join('{:>11}'.format(column) for column in columns)]
+
+        for row in self.report():
+            lines.append('{:<24}{:>6}'.format(row['collector'], row['calls']) +
+                         ''.join('{:>11.4f}'.format(row[column]) for column in columns))
+
+        return '\n'.join(lines)
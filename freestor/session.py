@@ -0,0 +1,111 @@
+"""On disk session id cache shared across processes."""
+import os
+import json
+import time
+import tempfile
+
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # file locking is not available on this platform (e.g. Windows)
+    fcntl = None
+
+
+DEFAULT_FILENAME = os.path.join(os.path.expanduser('~'), '.cache', 'freestor', 'sessions.json')
+
+# seconds a session id is reused since it was last handed out
+DEFAULT_MAX_AGE = 1800
+
+
+class SessionCache:
+    """
+    Cache session ids on disk, keyed by server and username.
+
+    The cache file is only readable by its owner and every access is done
+    holding an exclusive lock, so it can be shared by concurrent processes.
+    """
+
+    def __init__(self, filename=None, max_age=DEFAULT_MAX_AGE):
+        self.filename = filename or DEFAULT_FILENAME
+        self.max_age = max_age
+
+    def _key(self, server, username):
+        return '%s@%s' % (username, server)
+
+    @contextmanager
+    def _lock(self):
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        fd = os.open(self.filename + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # closing the file descriptor also releases the lock
+            os.close(fd)
+
+    def _load(self):
+        try:
+            with open(self.filename, 'r') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, sessions):
+        # write to a temporary file and rename it so readers never see a partial file
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.sessions')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(sessions, fp)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.filename)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def get(self, server, username, login):
+        """
+        Return a valid cached session id for the given server and username.
+
+        When there is none, login is called to get a new session id which
+        is then stored in the cache.
+        """
+
+        with self._lock():
+            sessions = self._load()
+            key = self._key(server, username)
+            session = sessions.get(key)
+            now = time.time()
+
+            if session and now - session.get('used', 0) < self.max_age:
+                session_id = session.get('id')
+            else:
+                session_id = login()
+
+            if session_id:
+                sessions[key] = {'id': session_id, 'used': now}
+                self._save(sessions)
+
+        return session_id
+
+    def invalidate(self, server, username, session_id=None):
+        """
+        Remove the cached session id for the given server and username.
+
+        If session_id is given it's only removed when it's still the cached one,
+        so a session already refreshed by another process is kept.
+        """
+
+        with self._lock():
+            sessions = self._load()
+            key = self._key(server, username)
+            session = sessions.get(key)
+
+            if session and (session_id is None or session.get('id') == session_id):
+                del sessions[key]
+                self._save(sessions)
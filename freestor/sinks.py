@@ -0,0 +1,255 @@
+"""Output sinks writing files atomically, with optional compression and rotation."""
+import io
+import os
+import time
+import shutil
+
+from uuid import uuid4
+
+try:
+    import fcntl
+except ImportError:
+    # file locking is not available on this platform (e.g. Windows)
+    fcntl = None
+
+
+# file extension of each supported compression
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+# bytes buffered before being handed to the compressor or written to disk
+BUFFER_SIZE = 1024 * 1024
+
+
+def compression_for(filename):
+    """Return the compression matching the filename extension, None if it's not compressed"""
+
+    for compression, extension in EXTENSIONS.items():
+        if filename.endswith(extension):
+            return compression
+
+    return None
+
+
+def with_extension(filename, compression=None):
+    """Return filename ending with the extension of the given compression, if any"""
+
+    if compression and not filename.endswith(EXTENSIONS[compression]):
+        filename += EXTENSIONS[compression]
+
+    return filename
+
+
+class Sink:
+    """
+    Text file written to a temporary file and renamed over filename on close.
+
+    Readers never see a partially written file, and if the sink is used as a
+    context manager and an exception is raised the file is left untouched.
+
+    compression may be either gzip or zstd, the latter requires the zstandard
+    package. By default it's taken from the filename extension (.gz or .zst),
+    a compression not matching the extension raises ValueError since files
+    are read back according to it.
+
+    In append mode the existing content is kept and new data is added after
+    it, compressed files get a new gzip member or zstd frame. An exclusive
+    lock is held on filename plus .lock until the sink is closed, so writers
+    appending to the same file take turns instead of losing each other's
+    rows, readers don't need it since the file is still replaced at once.
+
+    The existing file is rotated when it's at least max_bytes long or when it
+    was last written before the current interval, in seconds, started. For
+    example an interval of 86400 starts a new file every day. Rotated files
+    are kept with a number before their extension, up to backups of them:
+    report.csv.gz, report.1.csv.gz, report.2.csv.gz and so on.
+    """
+
+    def __init__(self, filename, mode='w', compression=None, max_bytes=None, interval=None,
+                 backups=5, buffer_size=BUFFER_SIZE):
+        if mode not in ('w', 'a'):
+            raise ValueError('Unsupported mode: %s' % mode)
+
+        if compression and compression not in EXTENSIONS:
+            raise ValueError('Unsupported compression: %s' % compression)
+        if compression and compression != compression_for(filename):
+            raise ValueError('Filename must end with %s to be compressed with %s: %s'
+                             % (EXTENSIONS[compression], compression, filename))
+        compression = compression_for(filename)
+
+        self.filename = filename
+        self.mode = mode
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backups = backups
+        self.buffer_size = buffer_size
+
+        self._lock = self._acquire() if mode == 'a' else None
+        try:
+            self.rotate = self._should_rotate()
+
+            # whether the file starts empty, so callers know if a header is needed
+            self.new = mode == 'w' or self.rotate or not os.path.exists(filename) or not os.path.getsize(filename)
+
+            self._open()
+        except BaseException:
+            self._release()
+            raise
+
+    def _acquire(self):
+        fd = os.open(self.filename + '.lock', os.O_RDWR | os.O_CREAT, 0o666)
+        if fcntl:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except Exception:
+                os.close(fd)
+                raise
+
+        return fd
+
+    def _release(self):
+        if self._lock is not None:
+            # closing the file descriptor also releases the lock
+            os.close(self._lock)
+            self._lock = None
+
+    def _should_rotate(self):
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return False
+
+        if self.max_bytes and st.st_size >= self.max_bytes:
+            return True
+
+        if self.interval and st.st_mtime // self.interval != time.time() // self.interval:
+            return True
+
+        return False
+
+    def _backup(self, number):
+        """Return the name of the given rotated file number"""
+
+        root, compression = self.filename, ''
+        if self.compression and root.endswith(EXTENSIONS[self.compression]):
+            compression = EXTENSIONS[self.compression]
+            root = root[:-len(compression)]
+        root, ext = os.path.splitext(root)
+
+        return '{}.{}{}{}'.format(root, number, ext, compression)
+
+    def _open(self):
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        self._tmp = os.path.join(directory, '.{}.{}.tmp'.format(os.path.basename(self.filename), uuid4().hex))
+        self._raw = open(self._tmp, 'xb', buffering=0)
+
+        try:
+            # keep the existing content when appending to it
+            if not self.new:
+                with open(self.filename, 'rb') as fp:
+                    shutil.copyfileobj(fp, self._raw)
+
+            stream = self._raw
+            if self.compression == 'gzip':
+                import gzip
+                stream = gzip.GzipFile(fileobj=self._raw, mode='wb')
+            elif self.compression == 'zstd':
+                import zstandard
+                stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+
+            buffered = io.BufferedWriter(stream, self.buffer_size)
+            self._text = io.TextIOWrapper(buffered, encoding='utf-8', newline='')
+        except BaseException:
+            self._raw.close()
+            os.remove(self._tmp)
+            raise
+
+    @property
+    def closed(self):
+        return self._raw.closed
+
+    def write(self, s):
+        return self._text.write(s)
+
+    def writelines(self, lines):
+        self._text.writelines(lines)
+
+    def flush(self):
+        self._text.flush()
+
+    def close(self):
+        """Finish writing, rotate the existing file if needed and move the new one in place"""
+
+        if self.closed:
+            return
+
+        try:
+            # detach each layer so only the compressor is closed, keeping the file open
+            stream = self._text.detach().detach()
+            if stream is not self._raw:
+                stream.close()
+            os.fsync(self._raw.fileno())
+        except BaseException:
+            self.abort()
+            raise
+
+        self._raw.close()
+
+        try:
+            if self.rotate:
+                self._rotate()
+            os.replace(self._tmp, self.filename)
+        finally:
+            self._release()
+
+    def abort(self):
+        """Discard everything written, leaving the existing file untouched"""
+
+        try:
+            if not self.closed:
+                # close every layer, whatever they write goes to the discarded file
+                try:
+                    self._text.close()
+                except Exception:
+                    pass
+                self._raw.close()
+            if os.path.exists(self._tmp):
+                os.remove(self._tmp)
+        finally:
+            self._release()
+
+    def _rotate(self):
+        if not self.backups:
+            return
+
+        for number in range(self.backups - 1, 0, -1):
+            if os.path.exists(self._backup(number)):
+                os.replace(self._backup(number), self._backup(number + 1))
+
+        os.replace(self.filename, self._backup(1))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def open_text(filename):
+    """Open a file written by a Sink for reading, decompressing it as needed"""
+
+    compression = compression_for(filename)
+
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(filename, 'rt', encoding='utf-8', newline='')
+
+    if compression == 'zstd':
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), read_across_frames=True)
+        return io.TextIOWrapper(io.BufferedReader(reader), encoding='utf-8', newline='')
+
+    return open(filename, 'r', encoding='utf-8', newline='')
@@ -0,0 +1,232 @@
+"""Incremental parsing of large JSON responses."""
+import re
+import json
+import codecs
+
+
+WHITESPACE = ' \t\n\r'
+
+# characters that matter while looking for the end of a value
+_STRUCTURE = re.compile(r'"(?:[^"\\]|\\.)*"|["\[\]{}]', re.DOTALL)
+_STRING = re.compile(r'["\\]')
+_DELIMITER = re.compile(r'[,\]}\s]')
+
+
+def _scan(text, idx, state):
+    """
+    Look for the end of a string, object or array in text, starting at idx.
+
+    state holds the nesting depth, whether it's inside a string and whether the
+    next character is escaped, so scanning can go on over the following chunk.
+    It returns the index right after the end of the value, -1 if it's not in text.
+    """
+
+    depth, in_string, escape = state
+    size = len(text)
+
+    while idx < size:
+        if escape:
+            idx += 1
+            escape = False
+        elif in_string:
+            match = _STRING.search(text, idx)
+            if not match:
+                break
+            idx = match.end()
+            if match.group() == '\\':
+                escape = True
+            else:
+                in_string = False
+                if not depth:
+                    return idx
+        else:
+            match = _STRUCTURE.search(text, idx)
+            if not match:
+                break
+            idx = match.end()
+            char = match.group()
+            if len(char) > 1:
+                # a whole string, unless it's the value itself it's just skipped
+                if not depth:
+                    return idx
+            elif char == '"':
+                # a string going on over the next chunk
+                in_string = True
+            elif char in '[{':
+                depth += 1
+            else:
+                depth -= 1
+                if not depth:
+                    return idx
+
+    state[:] = [depth, in_string, escape]
+    return -1
+
+
+class _Buffer:
+    """Text buffer filled on demand out of an iterable of byte chunks"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def read(self):
+        """Return the next chunk as text, None when there is no more data"""
+
+        if self.eof:
+            return None
+
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            return self.decoder.decode(b'', final=True) or None
+
+        return self.decoder.decode(chunk)
+
+    def fill(self):
+        """Read one more chunk into the buffer, returns False when there is no more data"""
+
+        text = self.read()
+        if text is None:
+            return False
+
+        # drop already consumed text so the buffer doesn't grow with the response
+        self.text = self.text[self.pos:] + text
+        self.pos = 0
+
+        return True
+
+    def peek(self):
+        """Return the next non whitespace character without consuming it"""
+
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                raise ValueError('Unexpected end of JSON data')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected %r at JSON data, got %r' % (char, self.text[self.pos]))
+        self.pos += 1
+
+    def _find_end(self, text, idx, primitive, state):
+        if primitive:
+            match = _DELIMITER.search(text, idx)
+            return match.start() if match else -1
+
+        return _scan(text, idx, state)
+
+    def end(self):
+        """
+        Return the index where the next value ends, reading as many chunks as needed.
+
+        Every character is scanned once and chunks of values spanning many
+        of them are joined only once the end of the value is found.
+        """
+
+        primitive = self.peek() not in '"[{'
+        state = [0, False, False]
+
+        end = self._find_end(self.text, self.pos, primitive, state)
+        if end >= 0:
+            return end
+
+        parts = [self.text[self.pos:]]
+        size = len(parts[0])
+        while True:
+            text = self.read()
+            if text is None:
+                # numbers and literals may end along with the data
+                if not primitive:
+                    raise ValueError('Unexpected end of JSON data')
+                end = size
+                break
+
+            parts.append(text)
+            end = self._find_end(text, 0, primitive, state)
+            if end >= 0:
+                end += size
+                break
+            size += len(text)
+
+        self.text = ''.join(parts)
+        self.pos = 0
+
+        return end
+
+    def skip(self):
+        """Consume the next JSON value without decoding it"""
+
+        self.pos = self.end()
+
+    def value(self, decoder):
+        """Decode and consume the next JSON value"""
+
+        self.peek()
+
+        # most values are already complete in the buffer, a value ending right
+        # at its end may be truncated though, like a number
+        try:
+            value, end = decoder.raw_decode(self.text, self.pos)
+            if end < len(self.text):
+                self.pos = end
+                return value
+        except ValueError:
+            pass
+
+        # otherwise look for its end first so it's decoded only once
+        self.end()
+        value, self.pos = decoder.raw_decode(self.text, self.pos)
+
+        return value
+
+
+def iter_json_array(chunks, *path):
+    """
+    Yield each element of the JSON array found at path, parsing it incrementally.
+
+    chunks is an iterable of bytes, like requests' Response.iter_content, and
+    path is the sequence of object keys leading to the array, for example:
+
+    iter_json_array(r.iter_content(), 'data', 'virtualdevices')
+
+    Elements are yielded as soon as they are fully received, other values on
+    the way are skipped and whatever follows the array is not read.
+    """
+
+    decoder = json.JSONDecoder()
+    buf = _Buffer(chunks)
+
+    for key in path:
+        buf.expect('{')
+        while True:
+            if buf.peek() == '}':
+                raise KeyError(key)
+            name = buf.value(decoder)
+            buf.expect(':')
+            if name == key:
+                break
+            buf.skip()
+            if buf.peek() == ',':
+                buf.expect(',')
+
+    if buf.peek() == 'n':
+        # the array may be null when there is nothing to report
+        buf.skip()
+        return
+
+    buf.expect('[')
+    if buf.peek() == ']':
+        return
+
+    while True:
+        yield buf.value(decoder)
+        if buf.peek() == ']':
+            return
+        buf.expect(',')
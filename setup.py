@@ -16,6 +16,10 @@ if __name__ == "__main__":
           url='http://github.com/ldfsilva/freestor',
           keywords=['freestor', 'requests', 'falconstor', 'ipstor'],
           install_requires=open(REQUIREMENTS).readlines(),
+          extras_require={
+              'analytics': ['numpy'],
+              'zstd': ['zstandard'],
+          },
           packages=['freestor'],
           package_dir={'freestor': 'freestor'},
           entry_points={
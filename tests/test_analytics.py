@@ -0,0 +1,130 @@
+import unittest
+from unittest.mock import patch
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+if numpy:
+    from freestor.analytics import pool_usage, vdev_usage, forecast
+
+
+@unittest.skipUnless(numpy, 'numpy is not installed')
+class TestAnalytics(unittest.TestCase):
+
+    def test_pool_usage(self):
+        """
+        Physical devices size and usage must be summed and filled by pool.
+        """
+
+        pdevs = [
+            {'pool': 'pool1', 'size': 100, 'used': 50},
+            {'pool': 'pool2', 'size': 200, 'used': None},
+            {'pool': 'pool1', 'size': '300', 'used': '250'},
+        ]
+
+        expected = [
+            {'pool': 'pool1', 'devices': 2, 'size': 400.0, 'used': 300.0, 'free': 100.0, 'fill': 0.75},
+            {'pool': 'pool2', 'devices': 1, 'size': 200.0, 'used': 0.0, 'free': 200.0, 'fill': 0.0},
+        ]
+
+        self.assertListEqual(expected, pool_usage(pdevs))
+
+    def test_vdev_usage(self):
+        """
+        Thin devices must be provisioned by fullsizemb and savings computed from deduperatio,
+        records loaded from CSV included.
+        """
+
+        vdevs = [
+            {'server': 'dagcdp01', 'sizemb': 1024, 'fullsizemb': 8192, 'usedmb': 1024, 'thin': True, 'deduperatio': 2},
+            {'server': 'dagcdp01', 'sizemb': 2048, 'fullsizemb': '', 'usedmb': 1024, 'thin': 'False', 'deduperatio': ''},
+            {'server': 'dagcdp02', 'sizemb': 512, 'usedmb': 0, 'thin': False},
+        ]
+
+        data = vdev_usage(vdevs)
+
+        self.assertEqual(['dagcdp01', 'dagcdp02'], [row['server'] for row in data])
+        self.assertEqual(1, data[0]['thin'])
+        self.assertEqual(10240.0, data[0]['provisionedmb'])
+        self.assertEqual(5.0, data[0]['overcommit'])
+        self.assertEqual(1024.0, data[0]['savedmb'])
+        self.assertEqual(1.5, data[0]['deduperatio'])
+        self.assertTrue(numpy.isnan(data[1]['overcommit']))
+
+    def test_forecast(self):
+        """
+        Growth must be fitted per group over all snapshots and projected up to capacity.
+        """
+
+        history = []
+        for day, used in ((1, 100), (2, 110), (4, 130)):
+            date = '201710%02d_16:23:59' % day
+            history.append({'date': date, 'pool': 'pool1', 'used': used / 2, 'size': 200})
+            history.append({'date': date, 'pool': 'pool1', 'used': used / 2, 'size': 200})
+            history.append({'date': date, 'pool': 'pool2', 'used': 50, 'size': 100})
+
+        data = forecast(history, 'used', 'size', by=('pool',), days=10)
+
+        self.assertEqual('pool1', data[0]['pool'])
+        self.assertEqual(3, data[0]['samples'])
+        self.assertEqual(130.0, data[0]['used'])
+        self.assertAlmostEqual(10.0, data[0]['growthperday'])
+        self.assertAlmostEqual(230.0, data[0]['forecast'])
+        self.assertAlmostEqual(27.0, data[0]['daystofull'])
+        self.assertAlmostEqual(0.0, data[1]['growthperday'])
+        self.assertEqual(float('inf'), data[1]['daystofull'])
+
+    def test_forecast_fleet(self):
+        """
+        Snapshots of many servers, each stamped with its own time, must be summed per day.
+        """
+
+        history = []
+        for day, a, b in ((1, 10, 20), (2, 20, 30)):
+            history.append({'date': '201710%02d_16:23:59' % day, 'server': 'a', 'pool': 'pool1', 'used': a, 'size': 100})
+            history.append({'date': '201710%02d_16:25:03' % day, 'server': 'b', 'pool': 'pool1', 'used': b, 'size': 100})
+
+        # an earlier run of the same day must be replaced by the latest one, not added
+        history.append({'date': '20171002_08:00:00', 'server': 'a', 'pool': 'pool1', 'used': 15, 'size': 100})
+
+        for by in ((), ('pool',)):
+            data = forecast(history, 'used', 'size', by=by)
+
+            self.assertEqual(1, len(data))
+            self.assertEqual(2, data[0]['samples'])
+            self.assertEqual(50.0, data[0]['used'])
+            self.assertEqual(200.0, data[0]['size'])
+            self.assertAlmostEqual(20.0, data[0]['growthperday'])
+            self.assertAlmostEqual(7.5, data[0]['daystofull'])
+
+    @patch('freestor.freestor.datetime')
+    @patch('freestor.FreeStor.get_virtual_device_details')
+    @patch('freestor.FreeStor.get_virtual_device')
+    @patch('freestor.FreeStor._post')
+    def test_vdev_usage_collected(self, mock_post, mock_list, mock_detail, mock_date):
+        """
+        Records collected from many servers must be aggregated per server.
+        """
+
+        from datetime import datetime
+        from freestor import FreeStor
+
+        mock_post.return_value = {'rc': 0, 'type': 'root', 'id': 'b5588eea-0354-46db-8934-5504204ad183'}
+        mock_list.return_value = [{'id': 1, 'name': 'vdev1'}]
+        mock_detail.return_value = {'sizemb': 1024, 'usedmb': 512, 'thin': False}
+
+        vdevs = []
+        for day in (1, 2):
+            mock_date.now.return_value = datetime(2017, 10, day, 16, 23, 59)
+            for server in ('dagcdp01', 'dagcdp02'):
+                vdevs += FreeStor(server, 'root', 'abc').get_vdevs()
+
+        data = vdev_usage(vdevs)
+        growth = forecast(vdevs, 'usedmb', 'sizemb')
+
+        self.assertEqual(['dagcdp01', 'dagcdp02'], [row['server'] for row in data])
+        self.assertEqual([2, 2], [row['devices'] for row in data])
+        self.assertEqual(['dagcdp01', 'dagcdp02'], [row['server'] for row in growth])
+        self.assertEqual([2, 2], [row['samples'] for row in growth])
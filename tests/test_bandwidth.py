@@ -0,0 +1,147 @@
+import os
+import unittest
+import tempfile
+from unittest.mock import patch, MagicMock
+from freestor import FreeStor
+from freestor.bandwidth import (BandwidthTester, get_replica_targets, parse_bandwidth,
+                                save_history, load_history, compare)
+
+
+class TestBandwidth(unittest.TestCase):
+
+    @patch('freestor.FreeStor._post')
+    def setUp(self, mock_post):
+        mock_post.return_value = {'rc': 0, 'type': 'root',
+                                  'id': 'b5588eea-0354-46db-8934-5504204ad183'}
+
+        self.cdp = FreeStor('dagcdp01', 'root', 'abc')
+
+    @patch('freestor.FreeStor.get_outgoing_replication_servers')
+    def test_get_replica_targets(self, mock_outgoing):
+        """
+        Replica servers must be returned only once, by ip address.
+        """
+
+        mock_outgoing.return_value = [
+            {'ipaddress': '10.0.0.20', 'devices': [1, 2]},
+            {'ipaddress': '10.0.0.21', 'devices': [3]},
+            {'ipaddress': '10.0.0.20', 'devices': [4]},
+        ]
+
+        self.assertListEqual(['10.0.0.20', '10.0.0.21'], get_replica_targets(self.cdp))
+
+    def test_parse_bandwidth(self):
+        """
+        Throughput must be parsed either from a data dictionary or data itself.
+        """
+
+        self.assertEqual((0, 112.5), parse_bandwidth({'rc': 0, 'data': {'throughput': '112.5'}}))
+        self.assertEqual((0, 80.0), parse_bandwidth({'rc': 0, 'data': 80}))
+        self.assertEqual((1, None), parse_bandwidth({'rc': 1, 'data': {}}))
+
+    @patch('freestor.FreeStor.get_badwidth')
+    def test_run(self, mock_bandwidth):
+        """
+        A result must be returned for each target, failures included, in the targets order.
+        """
+
+        ok = MagicMock()
+        ok.json.return_value = {'rc': 0, 'data': {'throughput': 100}}
+        failed = MagicMock()
+        failed.raise_for_status.side_effect = Exception('timeout')
+        rejected = MagicMock()
+        rejected.json.return_value = {'rc': 5, 'data': {}}
+        responses = {'10.0.0.20': ok, '10.0.0.21': failed, '10.0.0.22': rejected}
+        mock_bandwidth.side_effect = lambda target: responses[target]
+
+        tester = BandwidthTester(self.cdp, concurrency=2)
+        data = tester.run(['10.0.0.20', '10.0.0.21', '10.0.0.22'])
+
+        self.assertEqual(['10.0.0.20', '10.0.0.21', '10.0.0.22'], [result['target'] for result in data])
+        self.assertEqual(100.0, data[0]['throughputmbps'])
+        self.assertIsNone(data[0]['error'])
+        self.assertIsNone(data[1]['throughputmbps'])
+        self.assertEqual('timeout', data[1]['error'])
+        self.assertEqual(5, data[2]['rc'])
+        self.assertEqual('Bandwidth test failed with rc 5', data[2]['error'])
+
+    def test_history_compare(self):
+        """
+        Saved history must be loaded back and compared against newer results.
+        """
+
+        previous = [{'date': '20171003_16:23:59', 'server': 'dagcdp01',
+                     'target': '10.0.0.20', 'rc': 0, 'throughputmbps': 100.0}]
+        current = [{'server': 'dagcdp01', 'target': '10.0.0.20', 'throughputmbps': 80.0}]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'history.csv')
+            save_history(previous, filename)
+            trend = compare(load_history(filename), current)
+
+        expected = [{'server': 'dagcdp01', 'target': '10.0.0.20', 'previous': 100.0,
+                     'current': 80.0, 'change': -20.0}]
+        self.assertListEqual(expected, trend)
+
+    @patch('freestor.bandwidth.time')
+    @patch('freestor.FreeStor.get_badwidth')
+    def test_run_interval(self, mock_bandwidth, mock_time):
+        """
+        Tests must start interval seconds apart even when they finish at once.
+        """
+
+        clock = [0.0]
+
+        def sleep(delay):
+            clock[0] += delay
+
+        mock_time.monotonic.side_effect = lambda: clock[0]
+        mock_time.time.side_effect = lambda: clock[0]
+        mock_time.sleep.side_effect = sleep
+
+        starts = []
+
+        def bandwidth(target):
+            starts.append(clock[0])
+            raise Exception('connection refused')
+
+        mock_bandwidth.side_effect = bandwidth
+
+        tester = BandwidthTester(self.cdp, concurrency=3, interval=10)
+        tester.run(['10.0.0.20', '10.0.0.21', '10.0.0.22'])
+
+        # tests picked up by workers at the same time must be spaced as well
+        tester.test('10.0.0.20')
+        tester.test('10.0.0.21')
+
+        self.assertListEqual([0.0, 10.0, 20.0, 30.0, 40.0], sorted(starts))
+
+    @patch('freestor.FreeStor.get_badwidth')
+    @patch('freestor.FreeStor.get_outgoing_replication_servers')
+    @patch('freestor.FreeStor._post')
+    def test_cli_trend(self, mock_post, mock_outgoing, mock_bandwidth):
+        """
+        The cli must output the change against the history before adding the new results to it.
+        """
+
+        from io import StringIO
+        from freestor import cli
+
+        mock_post.return_value = {'rc': 0, 'type': 'root', 'id': 'b5588eea-0354-46db-8934-5504204ad183'}
+        mock_outgoing.return_value = [{'ipaddress': '10.0.0.20'}]
+        response = MagicMock()
+        response.json.side_effect = [{'rc': 0, 'data': 100}, {'rc': 0, 'data': 80}]
+        mock_bandwidth.return_value = response
+
+        with tempfile.TemporaryDirectory() as tmp:
+            history = os.path.join(tmp, 'history.csv')
+            argv = ['freestor', '-s', 'dagcdp01', '-u', 'root', '-p', 'abc', '--test-bandwidth',
+                    '--history', history, '--trend']
+            for run in range(2):
+                with patch('sys.argv', argv), patch('sys.stdout', new_callable=StringIO) as stdout:
+                    cli.main()
+
+            self.assertEqual(2, len(load_history(history)))
+
+        self.assertEqual('server,target,previous,current,change\r\n'
+                         'dagcdp01,10.0.0.20,100.0,80.0,-20.0\r\n', stdout.getvalue())
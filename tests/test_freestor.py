@@ -1,7 +1,10 @@
+import sys
 import unittest
 import json
+import subprocess
 from unittest.mock import patch
 from freestor import FreeStor
+from freestor.freestor import merge_fields
 
 
 def load_json(file_name):
@@ -12,6 +15,21 @@ def load_json(file_name):
     return json.loads(data)
 
 
+class TestImport(unittest.TestCase):
+
+    def test_cli_import_is_lazy(self):
+        """
+        Importing the cli must not load requests nor any output backend.
+        """
+
+        code = ("import sys, freestor.cli; "
+                "print(sorted({'requests', 'csv', 'concurrent.futures'} & set(sys.modules)))")
+        r = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE,
+                           universal_newlines=True, check=True)
+
+        self.assertEqual('[]', r.stdout.strip())
+
+
 class TestFreestor(unittest.TestCase):
 
     @patch('freestor.FreeStor._post')
@@ -167,14 +185,14 @@ Connections, 256 Snapshot, Email Alerts, Mirroring, Replication, iSCSI Boot, Mul
         from datetime import datetime
 
         expected = [
-            {'date': '20171003_16:23:59',
+            {'date': '20171003_16:23:59', 'server': 'dagcdp01',
             "key": "XXXXXXXXXXXXXXXXXXXXXXXXA",
             "registration": 0,
             "type": "Standard license for NSS, High Availability, HotZone, SafeCache, \
 Service Enabled Disk, Zero-Impact Backup Enabler",
             "asciikeycode": "AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA",
             "info": "BBBBBBBBBBBB"},
-            {'date': '20171003_16:23:59',
+            {'date': '20171003_16:23:59', 'server': 'dagcdp01',
             "key": "XXXXXXXXXXXXXXXXXXXXXXXXB",
             "registration": 0,
             "type": "Standard license for NSS, Base (8 iSCSI ports, Unlimited Client \
@@ -211,4 +229,77 @@ Multi-pathing), 8 FC Ports, Unlimited TimeMarks and Snapshot Copy"}
         mock_license.side_effect = licenses_detail
         licenses = self.cdp.get_licenses()
 
-        self.assertListEqual(expected, licenses)
\ No newline at end of file
+        self.assertListEqual(expected, licenses)
+
+    @patch('freestor.freestor.datetime')
+    @patch('freestor.FreeStor.get_virtual_device_details')
+    @patch('freestor.FreeStor.get_virtual_device')
+    def test_get_vdevs_fields_skip_detail(self, mock_list, mock_detail, mock_date):
+        """
+        When all requested fields are on the list response detail must not be requested
+        and only the requested fields must be returned.
+        """
+
+        from datetime import datetime
+
+        mock_date.now.return_value = datetime(2017, 10, 3, 16, 23, 59)
+        mock_list.return_value = [
+            {'id': 1, 'name': 'vdev1', 'sizemb': 1024, 'status': 'online'},
+            {'id': 2, 'name': 'vdev2', 'sizemb': 2048, 'status': 'online'},
+        ]
+
+        expected = [
+            {'date': '20171003_16:23:59', 'name': 'vdev1', 'sizemb': 1024},
+            {'date': '20171003_16:23:59', 'name': 'vdev2', 'sizemb': 2048},
+        ]
+        vdevs = self.cdp.get_vdevs(['date', 'name', 'sizemb'])
+
+        self.assertListEqual(expected, vdevs)
+        mock_detail.assert_not_called()
+
+    def test_merge_fields_stamp_precedence(self):
+        """
+        The stamp must take precedence over records whether fields are given or not.
+        """
+
+        stamp = {'date': '20171003_16:23:59', 'server': 'dagcdp01'}
+        records = ({'id': 1, 'server': '10.0.0.1'}, {'name': 'vdev1', 'date': 'never'})
+
+        self.assertDictEqual({'date': '20171003_16:23:59', 'server': 'dagcdp01', 'id': 1, 'name': 'vdev1'},
+                             merge_fields(stamp, None, *records))
+        self.assertDictEqual({'server': 'dagcdp01', 'date': '20171003_16:23:59', 'id': 1},
+                             merge_fields(stamp, ['server', 'date', 'id'], *records))
+
+    def test_csv_server_column_last(self):
+        """
+        The server must be output after the existing columns so their positions are kept.
+        """
+
+        from io import StringIO
+        from freestor.cli import f_csv
+
+        stamp = {'date': '20171003_16:23:59', 'server': 'dagcdp01'}
+        record = merge_fields(stamp, None, {'key': 'A', 'type': 'Standard'}, {'info': 'a'})
+
+        with patch('sys.stdout', new_callable=StringIO) as stdout:
+            f_csv([record], 'licenses')
+
+        self.assertEqual(['date', 'key', 'type', 'info', 'server'], list(record))
+        self.assertEqual('date,key,type,registration,asciikeycode,info,server\r\n'
+                         '20171003_16:23:59,A,Standard,,,a,dagcdp01\r\n', stdout.getvalue())
+
+    @patch('freestor.FreeStor.get_physical_device_detail')
+    @patch('freestor.FreeStor.get_physical_devices')
+    def test_get_pdevs_fields_from_detail(self, mock_list, mock_detail):
+        """
+        When a requested field is not on the list response detail must be requested
+        and merged, keeping only the requested fields.
+        """
+
+        mock_list.return_value = [{'id': 1, 'name': 'pdev1', 'size': 100}]
+        mock_detail.return_value = {'name': 'pdev1', 'firmware': '0001', 'segments': []}
+
+        pdevs = self.cdp.get_pdevs(['name', 'firmware'])
+
+        self.assertListEqual([{'name': 'pdev1', 'firmware': '0001'}], pdevs)
+        mock_detail.assert_called_once_with(1)
@@ -0,0 +1,107 @@
+import os
+import unittest
+import tempfile
+from unittest.mock import patch, MagicMock
+from freestor import FreeStor
+from freestor.profiling import Profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+    @patch('freestor.profiling.time.perf_counter')
+    def test_nested_phases_are_exclusive(self, mock_counter):
+        """
+        Time of a nested phase must only be accounted to the inner phase.
+        """
+
+        # collector start, decode start, network start, network end, decode end, collector end
+        mock_counter.side_effect = [0, 1, 2, 5, 6, 10]
+        profiler = Profiler()
+
+        with profiler.collector('get_vdevs'):
+            with profiler.phase('decode'):
+                with profiler.phase('network'):
+                    pass
+
+        report = profiler.report()[0]
+
+        self.assertEqual(10, report['total'])
+        self.assertEqual(3, report['network'])
+        self.assertEqual(2, report['decode'])
+        self.assertEqual(5, report['other'])
+
+    def test_phase_outside_collector(self):
+        """
+        Phases run outside of a collector must not be accounted.
+        """
+
+        profiler = Profiler()
+        with profiler.phase('network'):
+            pass
+
+        self.assertListEqual([], profiler.report())
+
+    @patch('requests.request')
+    @patch('freestor.FreeStor._post')
+    def test_get_licenses_profiled(self, mock_post, mock_request):
+        """
+        Collectors must be accounted once with their network, decode and merge phases,
+        dumping cProfile stats and tracemalloc snapshots when requested.
+        """
+
+        mock_post.return_value = {'rc': 0, 'type': 'root', 'id': 'b5588eea-0354-46db-8934-5504204ad183'}
+        response = MagicMock(status_code=200)
+        response.json.side_effect = [
+            {'rc': 0, 'data': {'licenseinfo': [{'key': 'A'}, {'key': 'B'}]}},
+            {'rc': 0, 'data': {'info': 'a'}},
+            {'rc': 0, 'data': {'info': 'b'}},
+        ]
+        mock_request.return_value = response
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # a missing dump directory must be created
+            dump_dir = os.path.join(tmp, 'profile', 'licenses')
+            profiler = Profiler(cprofile=True, tracemalloc=True, dump_dir=dump_dir)
+            cdp = FreeStor('dagcdp01', 'root', 'abc', profiler=profiler)
+            licenses = cdp.get_licenses()
+            dumps = sorted(os.path.splitext(name)[1] for name in os.listdir(dump_dir))
+
+        report = profiler.report()
+
+        self.assertEqual(2, len(licenses))
+        self.assertEqual(['get_licenses'], [row['collector'] for row in report])
+        self.assertEqual(1, report[0]['calls'])
+        for phase in ('network', 'decode', 'merge'):
+            self.assertGreater(report[0][phase], 0)
+        self.assertListEqual(['.prof', '.tracemalloc'], dumps)
+        self.assertIn('get_licenses', profiler.format_report())
+
+    @patch('freestor.FreeStor.get_license_detail')
+    @patch('freestor.FreeStor.enumerate_licenses')
+    @patch('freestor.FreeStor._post')
+    def test_cli_profile(self, mock_post, mock_enumerate, mock_license):
+        """
+        Collectors run from the cli must be accounted once, serialization included.
+        """
+
+        from io import StringIO
+        from freestor import cli
+
+        mock_post.return_value = {'rc': 0, 'type': 'root', 'id': 'b5588eea-0354-46db-8934-5504204ad183'}
+        mock_enumerate.return_value = [{'key': 'A'}]
+        mock_license.return_value = {'info': 'a'}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            argv = ['freestor', '-s', 'dagcdp01', '-u', 'root', '-p', 'abc', '--get-licenses',
+                    '--json', '--filename', os.path.join(tmp, 'licenses.json'), '--profile']
+            with patch('sys.argv', argv), patch('sys.stderr', new_callable=StringIO) as stderr:
+                cli.main()
+
+        rows = [line.split() for line in stderr.getvalue().splitlines()]
+
+        self.assertEqual(2, len(rows))
+        self.assertEqual(['get_licenses', '1'], rows[1][:2])
+        # serialize is accounted and the total covers it
+        serialize, total = float(rows[1][6]), float(rows[1][2])
+        self.assertGreater(serialize, 0)
+        self.assertGreaterEqual(total, serialize)
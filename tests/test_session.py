@@ -0,0 +1,100 @@
+import os
+import stat
+import unittest
+import tempfile
+from unittest.mock import patch, MagicMock
+from freestor import FreeStor
+from freestor.session import SessionCache
+
+
+SESSION_ID = 'b5588eea-0354-46db-8934-5504204ad183'
+
+
+class TestSessionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = SessionCache(os.path.join(self.tmp.name, 'sessions.json'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_get_reuses_session(self):
+        """
+        A cached session id must be reused instead of logging in again.
+        """
+
+        login = MagicMock(return_value=SESSION_ID)
+
+        self.assertEqual(SESSION_ID, self.cache.get('dagcdp01', 'root', login))
+        self.assertEqual(SESSION_ID, self.cache.get('dagcdp01', 'root', login))
+        self.assertEqual(1, login.call_count)
+
+        # file must be readable by its owner only
+        mode = stat.S_IMODE(os.stat(self.cache.filename).st_mode)
+        self.assertEqual(0o600, mode)
+
+    def test_get_expired_session(self):
+        """
+        An expired session id must be replaced by a new one.
+        """
+
+        self.cache.max_age = 0
+        login = MagicMock(side_effect=['a' * 36, 'b' * 36])
+
+        self.cache.get('dagcdp01', 'root', login)
+
+        self.assertEqual('b' * 36, self.cache.get('dagcdp01', 'root', login))
+
+    def test_invalidate_refreshed_session(self):
+        """
+        A session id refreshed by another process must not be invalidated.
+        """
+
+        self.cache.get('dagcdp01', 'root', lambda: SESSION_ID)
+        self.cache.invalidate('dagcdp01', 'root', 'a' * 36)
+        login = MagicMock(return_value='b' * 36)
+
+        self.assertEqual(SESSION_ID, self.cache.get('dagcdp01', 'root', login))
+        self.cache.invalidate('dagcdp01', 'root', SESSION_ID)
+        self.assertEqual('b' * 36, self.cache.get('dagcdp01', 'root', login))
+
+    @patch('requests.request')
+    @patch('freestor.FreeStor._post')
+    def test_freestor_refresh_rejected_session(self, mock_post, mock_request):
+        """
+        A session rejected by the server must be refreshed and the request retried.
+        """
+
+        self.cache.get('dagcdp01', 'root', lambda: 'a' * 36)
+        mock_post.return_value = {'rc': 0, 'type': 'root', 'id': SESSION_ID}
+        rejected = MagicMock(status_code=401)
+        accepted = MagicMock(status_code=200)
+        accepted.json.return_value = {'rc': 0, 'data': []}
+        mock_request.side_effect = [rejected, accepted]
+
+        cdp = FreeStor('dagcdp01', 'root', 'abc', self.cache)
+        mock_post.assert_not_called()
+
+        self.assertEqual({'rc': 0, 'data': []}, cdp._get(cdp._url('server/license/')))
+        self.assertEqual(SESSION_ID, cdp.session_id)
+        self.assertEqual({'session_id': SESSION_ID}, mock_request.call_args[1]['cookies'])
+
+    @patch('requests.request')
+    @patch('freestor.FreeStor._post')
+    def test_freestor_refresh_rejected_session_put(self, mock_post, mock_request):
+        """
+        PUT requests, like bandwidth tests, must also refresh a rejected session.
+        """
+
+        self.cache.get('dagcdp01', 'root', lambda: 'a' * 36)
+        mock_post.return_value = {'rc': 0, 'type': 'root', 'id': SESSION_ID}
+        rejected = MagicMock(status_code=401)
+        accepted = MagicMock(status_code=200)
+        mock_request.side_effect = [rejected, accepted]
+
+        cdp = FreeStor('dagcdp01', 'root', 'abc', self.cache)
+
+        self.assertIs(accepted, cdp.get_badwidth('10.0.0.20'))
+        self.assertEqual('PUT', mock_request.call_args[0][0])
+        self.assertEqual({'session_id': SESSION_ID}, mock_request.call_args[1]['cookies'])
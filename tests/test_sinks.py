@@ -0,0 +1,238 @@
+import os
+import sys
+import time
+import subprocess
+import unittest
+import tempfile
+import threading
+from unittest.mock import patch, MagicMock
+from freestor import FreeStor
+from freestor.sinks import Sink, open_text
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class TestSinks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'report.csv.gz')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, filename=None):
+        with open_text(filename or self.filename) as fp:
+            return fp.read()
+
+    def test_abort_keeps_existing_file(self):
+        """
+        An exception while writing must leave the existing file untouched and no temporary file.
+        """
+
+        with Sink(self.filename) as fp:
+            fp.write('a,b\r\n')
+
+        with self.assertRaises(RuntimeError):
+            with Sink(self.filename) as fp:
+                fp.write('partial')
+                raise RuntimeError()
+
+        self.assertEqual('a,b\r\n', self.read())
+        self.assertListEqual(['report.csv.gz'], os.listdir(self.tmp.name))
+
+    def test_append_compressed(self):
+        """
+        Appending to a compressed file must keep its content.
+        """
+
+        with Sink(self.filename, 'a') as fp:
+            self.assertTrue(fp.new)
+            fp.write('a,b\r\n')
+
+        with Sink(self.filename, 'a') as fp:
+            self.assertFalse(fp.new)
+            fp.write('1,2\r\n')
+
+        self.assertEqual('a,b\r\n1,2\r\n', self.read())
+
+    def test_append_abort(self):
+        """
+        Aborting an append must truncate the file back to its previous content.
+        """
+
+        with Sink(self.filename, 'a') as fp:
+            fp.write('a,b\r\n')
+
+        with self.assertRaises(RuntimeError):
+            with Sink(self.filename, 'a', buffer_size=1) as fp:
+                fp.write('partial\r\n' * 1000)
+                raise RuntimeError()
+
+        self.assertEqual('a,b\r\n', self.read())
+
+    def test_append_killed(self):
+        """
+        A writer killed while appending must leave the existing file readable and untouched.
+        """
+
+        with Sink(self.filename, 'a') as fp:
+            fp.write('a,b\r\n')
+
+        code = ("import os; from freestor.sinks import Sink; "
+                "fp = Sink(%r, 'a', buffer_size=1); fp.write('partial\\r\\n' * 1000); fp.flush(); os._exit(0)"
+                % self.filename)
+        subprocess.check_call([sys.executable, '-c', code])
+
+        self.assertEqual('a,b\r\n', self.read())
+
+    def test_compression_mismatch(self):
+        """
+        A compression not matching the filename extension must be rejected.
+        """
+
+        for filename, compression in (('report.csv', 'gzip'), ('report.csv.zst', 'gzip')):
+            with self.assertRaises(ValueError):
+                Sink(os.path.join(self.tmp.name, filename), compression=compression)
+
+        self.assertListEqual([], os.listdir(self.tmp.name))
+
+    def test_append_concurrent(self):
+        """
+        Concurrent writers appending to the same file must not lose each other's rows.
+        """
+
+        def append(name):
+            for idx in range(50):
+                with Sink(self.filename, 'a') as fp:
+                    fp.write('%s,%s\r\n' % (name, idx))
+
+        threads = [threading.Thread(target=append, args=(name,)) for name in 'ab']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expected = sorted('%s,%s' % (name, idx) for name in 'ab' for idx in range(50))
+        self.assertListEqual(expected, sorted(self.read().splitlines()))
+
+    def test_rotate_size(self):
+        """
+        Files reaching max_bytes must be rotated, keeping up to backups of them.
+        """
+
+        for idx in range(4):
+            with Sink(self.filename, 'a', max_bytes=1, backups=2) as fp:
+                fp.write('%s\r\n' % idx)
+
+        self.assertListEqual(['report.1.csv.gz', 'report.2.csv.gz', 'report.csv.gz', 'report.csv.gz.lock'],
+                             sorted(os.listdir(self.tmp.name)))
+        self.assertEqual('3\r\n', self.read())
+        self.assertEqual('1\r\n', self.read(os.path.join(self.tmp.name, 'report.2.csv.gz')))
+
+    def test_rotate_interval(self):
+        """
+        Files last written before the current interval must be rotated.
+        """
+
+        with Sink(self.filename, 'a', interval=3600) as fp:
+            fp.write('old\r\n')
+
+        past = time.time() - 7200
+        os.utime(self.filename, (past, past))
+
+        with Sink(self.filename, 'a', interval=3600) as fp:
+            self.assertTrue(fp.new)
+            fp.write('new\r\n')
+
+        self.assertEqual('new\r\n', self.read())
+        self.assertEqual('old\r\n', self.read(os.path.join(self.tmp.name, 'report.1.csv.gz')))
+
+    @unittest.skipUnless(zstandard, 'zstandard is not installed')
+    def test_append_zstd(self):
+        """
+        Appending to a zstd file must keep its content.
+        """
+
+        filename = os.path.join(self.tmp.name, 'report.csv.zst')
+        for line in ('a,b\r\n', '1,2\r\n'):
+            with Sink(filename, 'a') as fp:
+                fp.write(line)
+
+        self.assertEqual('a,b\r\n1,2\r\n', self.read(filename))
+
+    @patch('freestor.FreeStor.get_fc_detail')
+    @patch('freestor.FreeStor.get_fc_adapters')
+    @patch('freestor.FreeStor._post')
+    def test_get_fc_detail_all_compressed(self, mock_post, mock_adapters, mock_detail):
+        """
+        The fc report must be written compressed when requested.
+        """
+
+        mock_post.return_value = {'rc': 0, 'type': 'root', 'id': 'b5588eea-0354-46db-8934-5504204ad183'}
+        mock_adapters.return_value = [100]
+        mock_detail.return_value = [['FC Adapter 100', 'QLogic', 'initiator', 'linkdown',
+                                     '21:00:00:e0:8b:94:30:05', 'initiator']]
+
+        cdp = FreeStor('dagcdp01', 'root', 'abc')
+        cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        try:
+            cdp.get_fc_detail_all(compression='gzip')
+        finally:
+            os.chdir(cwd)
+
+        files = os.listdir(self.tmp.name)
+        self.assertEqual(1, len(files))
+        self.assertTrue(files[0].startswith('fc_adapters_info_') and files[0].endswith('.csv.gz'))
+        self.assertEqual('server,adapter,vendor,fc mode,status,wwpn,wwpn mode\n'
+                         'dagcdp01,FC Adapter 100,QLogic,initiator,linkdown,21:00:00:e0:8b:94:30:05,initiator\n',
+                         self.read(os.path.join(self.tmp.name, files[0])))
+
+    @patch('freestor.FreeStor.get_badwidth')
+    @patch('freestor.FreeStor.get_outgoing_replication_servers')
+    @patch('freestor.FreeStor._post')
+    def test_cli_compress(self, mock_post, mock_outgoing, mock_bandwidth):
+        """
+        The cli must add the compression extension to the output and leave the history options alone.
+        """
+
+        from freestor import cli
+
+        mock_post.return_value = {'rc': 0, 'type': 'root', 'id': 'b5588eea-0354-46db-8934-5504204ad183'}
+        mock_outgoing.return_value = [{'ipaddress': '10.0.0.20'}]
+        response = MagicMock()
+        response.json.return_value = {'rc': 0, 'data': 100}
+        mock_bandwidth.return_value = response
+
+        output = os.path.join(self.tmp.name, 'out.csv')
+        history = os.path.join(self.tmp.name, 'history.csv')
+        argv = ['freestor', '-s', 'dagcdp01', '-u', 'root', '-p', 'abc', '--test-bandwidth', '--history', history,
+                '--filename', output, '--compress', 'gzip', '--rotate-size', '1']
+        for run in range(2):
+            with patch('sys.argv', argv):
+                cli.main()
+
+        self.assertListEqual(['history.csv', 'history.csv.lock', 'out.1.csv.gz', 'out.csv.gz'],
+                             sorted(os.listdir(self.tmp.name)))
+        self.assertEqual(3, len(self.read(history).splitlines()))
+        self.assertTrue(self.read(output + '.gz').startswith('date,server,target'))
+
+    def test_csv_interrupted(self):
+        """
+        An interrupted CSV output must leave no temporary file behind.
+        """
+
+        from freestor.cli import f_csv
+
+        def data():
+            yield {'date': '20171003_16:23:59', 'key': 'A'}
+            raise KeyboardInterrupt()
+
+        with self.assertRaises(KeyboardInterrupt):
+            f_csv(data(), 'licenses', self.filename)
+
+        self.assertListEqual([], os.listdir(self.tmp.name))
@@ -0,0 +1,108 @@
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+from freestor import FreeStor
+from freestor.stream import iter_json_array
+
+
+def chunked(data, size):
+    """Split bytes into chunks of the given size"""
+    return [data[idx:idx + size] for idx in range(0, len(data), size)]
+
+
+class TestStream(unittest.TestCase):
+
+    def setUp(self):
+        self.response = {
+            'rc': 0,
+            'data': {
+                'total': 3,
+                'extra': {'nested': [1, 2, {'a': 'b'}], 'tricky': ['br]ack{et "q" \\', '\\', '']},
+                'ratio': -12.5e3,
+                'flag': None,
+                'virtualdevices': [
+                    {'id': 12345, 'name': 'vdevção', 'sizemb': 1024.5, 'thin': True},
+                    {'id': 2, 'name': 'vdev "2" [x] \\', 'clients': [], 'pdev': None},
+                    {'id': 3, 'name': 'vdev3', 'deduperatio': -1e-3},
+                ],
+            },
+        }
+        self.body = json.dumps(self.response, indent=2).encode('utf-8')
+
+    def test_iter_json_array_chunks(self):
+        """
+        Elements must be parsed the same way no matter where chunks are split.
+        """
+
+        expected = self.response['data']['virtualdevices']
+        for size in (1, 2, 3, 7, len(self.body)):
+            devices = list(iter_json_array(chunked(self.body, size), 'data', 'virtualdevices'))
+            self.assertListEqual(expected, devices)
+
+    def test_iter_json_array_large_sibling(self):
+        """
+        Large values before the array must be skipped over many chunks.
+        """
+
+        response = {'data': {'other': [{'name': 'dev{%s}"' % idx, 'size': idx} for idx in range(20000)],
+                             'physicaldevices': [{'id': 1}, 2, 'three']}}
+        body = json.dumps(response).encode('utf-8')
+
+        devices = list(iter_json_array(chunked(body, 1024), 'data', 'physicaldevices'))
+
+        self.assertListEqual([{'id': 1}, 2, 'three'], devices)
+
+    def test_iter_json_array_is_lazy(self):
+        """
+        An element must be yielded before the rest of the response is read.
+        """
+
+        read = []
+
+        def chunks():
+            for chunk in chunked(self.body, 16):
+                read.append(chunk)
+                yield chunk
+
+        devices = iter_json_array(chunks(), 'data', 'virtualdevices')
+        next(devices)
+
+        self.assertLess(sum(len(chunk) for chunk in read), len(self.body))
+
+    def test_iter_json_array_empty(self):
+        """
+        Empty or null arrays must yield nothing and missing keys must raise KeyError.
+        """
+
+        self.assertListEqual([], list(iter_json_array([b'{"data": {"physicaldevices": []}}'],
+                                                      'data', 'physicaldevices')))
+        self.assertListEqual([], list(iter_json_array([b'{"data": {"physicaldevices": null}}'],
+                                                      'data', 'physicaldevices')))
+        with self.assertRaises(KeyError):
+            list(iter_json_array([b'{"rc": 0, "data": {}}'], 'data', 'physicaldevices'))
+
+    @patch('requests.request')
+    @patch('freestor.FreeStor.get_virtual_device_details')
+    @patch('freestor.FreeStor._post')
+    def test_get_vdevs_stream(self, mock_post, mock_detail, mock_request):
+        """
+        Streamed devices must be merged with their details as they are received.
+        """
+
+        mock_post.return_value = {'rc': 0, 'type': 'root', 'id': 'b5588eea-0354-46db-8934-5504204ad183'}
+        response = MagicMock(status_code=200)
+        response.iter_content.return_value = chunked(self.body, 5)
+        mock_request.return_value = response
+        mock_detail.side_effect = lambda guid: {'detail': guid}
+
+        cdp = FreeStor('dagcdp01', 'root', 'abc')
+        vdevs = cdp.get_vdevs(['name', 'detail'], stream=True)
+
+        expected = [
+            {'name': 'vdevção', 'detail': 12345},
+            {'name': 'vdev "2" [x] \\', 'detail': 2},
+            {'name': 'vdev3', 'detail': 3},
+        ]
+        self.assertListEqual(expected, vdevs)
+        self.assertTrue(mock_request.call_args[1]['stream'])
+        response.close.assert_called_once_with()